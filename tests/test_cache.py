@@ -0,0 +1,131 @@
+import socket
+import socketserver
+import threading
+import unittest
+
+import ycast.cache as cache
+
+
+class MemcachedStandIn(socketserver.StreamRequestHandler):
+    """
+    Just enough of the memcached text protocol (get, set and delete) to talk to MemcachedCache.
+    """
+    store = {}
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command, *arguments = line.split()
+            if command == b'get':
+                for key in arguments:
+                    if key in self.store:
+                        value = self.store[key]
+                        self.wfile.write(b'VALUE ' + key + b' 0 ' + str(len(value)).encode() + b'\r\n' +
+                                         value + b'\r\n')
+                self.wfile.write(b'END\r\n')
+            elif command == b'set':
+                self.store[arguments[0]] = self.rfile.read(int(arguments[3]) + 2)[:-2]
+                self.wfile.write(b'STORED\r\n')
+            elif command == b'delete':
+                self.wfile.write(b'DELETED\r\n' if self.store.pop(arguments[0], None) else b'NOT_FOUND\r\n')
+            else:
+                self.wfile.write(b'ERROR\r\n')
+
+
+class MemcachedCacheTest(unittest.TestCase):
+    def setUp(self):
+        MemcachedStandIn.store = {}
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), MemcachedStandIn)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.backend = cache.MemcachedCache('127.0.0.1', self.server.server_address[1])
+
+    def tearDown(self):
+        self.backend._close_connection()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_set_get_delete(self):
+        self.backend.set_many({'a': b'1', 'b': b'two\r\nlines'}, 60)
+        self.assertEqual(self.backend.get_many(['a', 'b', 'c']), {'a': b'1', 'b': b'two\r\nlines'})
+        self.backend.delete('a')
+        self.assertEqual(self.backend.get_many(['a', 'b']), {'b': b'two\r\nlines'})
+
+    def test_empty_requests(self):
+        self.assertEqual(self.backend.get_many([]), {})
+        self.backend.set_many({})
+
+    def test_module_api(self):
+        backend = cache.backend
+        cache.backend = self.backend
+        try:
+            query = 'search:200:rock \x01 ä'
+            cache.set_json(query, [1, 2], 60)
+            self.assertEqual(cache.get_json(query), [1, 2])
+            self.assertEqual(list(MemcachedStandIn.store), [cache.get_key(query).encode()])
+        finally:
+            cache.backend = backend
+
+
+class MemcachedErrorTest(unittest.TestCase):
+    def get_many_with_reply(self, reply):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+
+        def answer():
+            connection, _ = server.accept()
+            with connection:
+                connection.recv(1024)
+                connection.sendall(reply)
+
+        thread = threading.Thread(target=answer, daemon=True)
+        thread.start()
+        backend = cache.MemcachedCache('127.0.0.1', server.getsockname()[1])
+        with self.assertLogs(level='ERROR'):
+            values = backend.get_many(['key'])
+        thread.join()
+        server.close()
+        return values
+
+    def test_malformed_value_line(self):
+        self.assertEqual(self.get_many_with_reply(b'VALUE key 0 many\r\n'), {})
+        self.assertEqual(self.get_many_with_reply(b'VALUE key\r\n'), {})
+
+    def test_unexpected_reply(self):
+        self.assertEqual(self.get_many_with_reply(b'SERVER_ERROR out of memory\r\n'), {})
+
+    def test_unreachable(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        port = server.getsockname()[1]
+        server.close()
+        backend = cache.MemcachedCache('127.0.0.1', port)
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(backend.get_many(['key']), {})
+            backend.set_many({'key': b'value'})
+
+
+class KeyTest(unittest.TestCase):
+    def test_plain_keys_are_kept(self):
+        self.assertEqual(cache.get_key('station:abc-123'), 'station:abc-123')
+
+    def test_unsafe_keys_are_hashed(self):
+        for key in ['a b', 'a\x01b', 'a\x7fb', 'ä', 'x' * (cache.MAX_KEY_LENGTH + 1)]:
+            self.assertTrue(cache.get_key(key).startswith('sha1:'), repr(key))
+            self.assertLessEqual(len(cache.get_key(key)), cache.MAX_KEY_LENGTH)
+
+
+class MemoryCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        backend = cache.MemoryCache(max_size=2)
+        backend.set_many({'a': b'1', 'b': b'2'})
+        backend.get_many(['a'])
+        backend.set_many({'c': b'3'})
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), {'a': b'1', 'c': b'3'})
+
+
+if __name__ == '__main__':
+    unittest.main()
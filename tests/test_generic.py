@@ -0,0 +1,55 @@
+import random
+import string
+import unittest
+
+import ycast.generic as generic
+
+
+class BucketIndexTest(unittest.TestCase):
+    def check_index(self, names, target_size):
+        bucket_index = generic.get_bucket_index(names, target_size)
+        labels = [label for label, _ in bucket_index]
+        self.assertEqual(len(labels), len(set(labels)), labels)
+        for label in labels:
+            self.assertTrue(label)
+            self.assertFalse(label.startswith('-'), label)
+        positions = [position for _, bucket_positions in bucket_index for position in bucket_positions]
+        self.assertEqual(sorted(positions), list(range(len(names))))
+        # Every bucket ends before the next one starts
+        keys = [generic.get_bucket_key(name) for name in names]
+        for (_, positions), (_, next_positions) in zip(bucket_index, bucket_index[1:]):
+            self.assertLess(max(keys[position] for position in positions),
+                            min(keys[position] for position in next_positions))
+        return bucket_index
+
+    def test_random_names(self):
+        randomizer = random.Random(0)
+        for target_size in (3, 10, 40):
+            names = [''.join(randomizer.choice(string.ascii_letters + string.digits + ' -!') for _ in
+                             range(randomizer.randint(0, 8))) for _ in range(2000)]
+            self.check_index(names, target_size)
+
+    def test_shared_prefix(self):
+        names = ['Station ' + str(number) for number in range(100)]
+        bucket_index = self.check_index(names, 10)
+        self.assertGreater(len(bucket_index), 1)
+
+    def test_names_without_letters(self):
+        bucket_index = self.check_index(['!!!', '???', '', '-5 Radio', '5 Live', 'Radio'], 2)
+        self.assertEqual(bucket_index[0][0], '#')
+
+    def test_equal_names_stay_together(self):
+        names = ['Radio'] * 10 + ['Rock', 'Rock FM', 'Rockantenne']
+        bucket_index = self.check_index(names, 3)
+        self.assertIn(list(range(10)), [sorted(positions) for _, positions in bucket_index])
+
+    def test_non_ascii_names(self):
+        self.check_index(['Ábc', 'abd', 'Äpfel', '日本', 'Ωmega', '★'], 2)
+
+    def test_sparse_letters_are_merged(self):
+        bucket_index = self.check_index(['Alpha', 'Bravo', 'Charlie', 'Delta'], 2)
+        self.assertEqual([label for label, _ in bucket_index], ['A-B', 'C-D'])
+
+
+if __name__ == '__main__':
+    unittest.main()
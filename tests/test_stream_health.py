@@ -0,0 +1,169 @@
+import socket
+import threading
+import time
+import unittest
+
+import ycast.stream_health as stream_health
+
+
+class StreamServer:
+    """
+    Answers every connection with the given raw reply, so any (broken) status line can be served.
+    """
+    def __init__(self, replies):
+        self.replies = replies
+        self.requests = []
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen()
+        self.port = self.socket.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.answer, args=(connection,), daemon=True).start()
+
+    def answer(self, connection):
+        with connection:
+            request = b''
+            while b'\r\n\r\n' not in request:
+                data = connection.recv(1024)
+                if not data:
+                    return
+                request += data
+            path = request.split()[1].decode()
+            self.requests.append(path)
+            reply = self.replies.get(path, b'HTTP/1.0 404 Not Found\r\n\r\n')
+            if callable(reply):
+                reply(connection)
+            else:
+                connection.sendall(reply)
+
+    def get_url(self, path):
+        return 'http://127.0.0.1:' + str(self.port) + path
+
+    def close(self):
+        self.socket.close()
+
+
+def send_headers_only(connection):
+    connection.sendall(b'HTTP/1.0 200 OK\r\nContent-Type: audio/mpeg\r\n\r\n')
+    time.sleep(stream_health.PROBE_TIMEOUT * 2)
+
+
+class ProbeTest(unittest.TestCase):
+    def setUp(self):
+        self.timeout = stream_health.PROBE_TIMEOUT
+        stream_health.PROBE_TIMEOUT = 0.5
+        stream_health.PROBE_PRIVATE_ADDRESSES = True
+        self.server = StreamServer({
+            '/http': b'HTTP/1.1 200 OK\r\nContent-Type: audio/mpeg\r\n\r\n' + b'\xff' * 2048,
+            '/icy': b'ICY 200 OK\r\nicy-name: Test\r\ncontent-type: audio/aacp\r\n\r\n' + b'\xff' * 512,
+            '/redirect': b'HTTP/1.0 302 Found\r\nLocation: /icy\r\n\r\n',
+            '/loop': b'HTTP/1.0 302 Found\r\nLocation: /loop\r\n\r\n',
+            '/headers-only': send_headers_only,
+            '/garbage': b'garbage\r\n\r\n'
+        })
+
+    def tearDown(self):
+        self.server.close()
+        stream_health.PROBE_TIMEOUT = self.timeout
+        stream_health.PROBE_PRIVATE_ADDRESSES = False
+
+    def probe(self, path):
+        return stream_health.probe(self.server.get_url(path))
+
+    def test_http_stream(self):
+        health = self.probe('/http')
+        self.assertTrue(health['reachable'])
+        self.assertEqual(health['status'], 200)
+        self.assertEqual(health['codec'], 'audio/mpeg')
+
+    def test_icy_stream(self):
+        health = self.probe('/icy')
+        self.assertTrue(health['reachable'])
+        self.assertEqual(health['codec'], 'audio/aacp')
+
+    def test_redirect(self):
+        self.assertTrue(self.probe('/redirect')['reachable'])
+        self.assertEqual(self.server.requests, ['/redirect', '/icy'])
+
+    def test_redirect_loop(self):
+        self.assertFalse(self.probe('/loop')['reachable'])
+        self.assertEqual(len(self.server.requests), stream_health.PROBE_MAX_REDIRECTS + 1)
+
+    def test_headers_only(self):
+        self.assertFalse(self.probe('/headers-only')['reachable'])
+
+    def test_not_found(self):
+        health = self.probe('/missing')
+        self.assertFalse(health['reachable'])
+        self.assertEqual(health['status'], 404)
+
+    def test_garbage(self):
+        self.assertFalse(self.probe('/garbage')['reachable'])
+
+    def test_refused(self):
+        self.server.close()
+        self.assertFalse(self.probe('/http')['reachable'])
+
+    def test_unsupported_url(self):
+        self.assertFalse(stream_health.probe('ftp://127.0.0.1/stream')['reachable'])
+
+
+class PrivateAddressTest(unittest.TestCase):
+    def test_private_addresses_are_skipped(self):
+        server = StreamServer({'/http': b'HTTP/1.0 200 OK\r\n\r\nstream'})
+        try:
+            for url in [server.get_url('/http'), 'http://10.0.0.1/', 'http://192.168.1.1:8000/', 'http://[::1]/',
+                        'http://169.254.169.254/']:
+                self.assertIsNone(stream_health.probe(url), url)
+            self.assertEqual(server.requests, [])
+        finally:
+            server.close()
+
+
+class SubmitTest(unittest.TestCase):
+    def setUp(self):
+        self.probe = stream_health.probe
+        self.active = {}
+        self.peak = {}
+        self.lock = threading.Lock()
+        stream_health.probe = self.slow_probe
+        stream_health.enabled = True
+
+    def tearDown(self):
+        stream_health.probe = self.probe
+        stream_health.enabled = False
+
+    def slow_probe(self, url):
+        host = url.split('/')[2]
+        with self.lock:
+            self.active[host] = self.active.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        time.sleep(0.05)
+        with self.lock:
+            self.active[host] -= 1
+        return {'reachable': not url.endswith('/dead')}
+
+    def test_probes_per_host_are_queued(self):
+        stations = [('cdn-' + str(i), 'http://cdn.example/' + str(i)) for i in range(10)]
+        stations.append(('dead', 'http://other.example/dead'))
+        stream_health.submit(stations)
+        deadline = time.time() + 10
+        while stream_health.pending and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(stream_health.pending)
+        self.assertEqual(self.peak['cdn.example'], stream_health.PROBE_PER_HOST)
+        health = stream_health.get_health([station_id for station_id, _ in stations])
+        self.assertEqual(len(health), len(stations))
+        self.assertFalse(health['dead']['reachable'])
+        self.assertFalse(stream_health.host_probes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@ import sys
 
 from ycast import __version__
 from ycast import server
+from ycast import logs
 
 logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S', level=logging.INFO)
 
@@ -15,6 +16,26 @@ def launch_server():
     parser.add_argument('-c', action='store', dest='config', help='Station configuration', default=None)
     parser.add_argument('-l', action='store', dest='address', help='Listen address', default='127.0.0.1')
     parser.add_argument('-p', action='store', dest='port', type=int, help='Listen port', default=8001)
+    parser.add_argument('-z', action='store_true', dest='compression', help='Enable response compression')
+    parser.add_argument('-r', action='store_true', dest='rate_limiting',
+                        help='Enable per-client rate limiting of expensive requests')
+    parser.add_argument('-x', action='store', dest='trusted_proxies', type=int, default=0,
+                        help='Number of reverse proxies in front of YCast whose X-Forwarded-For header is trusted')
+    parser.add_argument('-b', action='store', dest='cache_backend', default=None,
+                        help='Cache backend (memory, sqlite[:<path>] or memcached://<host>[:<port>])')
+    parser.add_argument('-P', action='store_true', dest='request_profiling',
+                        help='Enable request profiling and slow request capture')
+    parser.add_argument('-T', action='store', dest='admin_token', default=None,
+                        help='Token which grants access to profiling from other than local addresses')
+    parser.add_argument('-a', action='store_true', dest='async_logging',
+                        help='Log from a background thread and suppress repeating warnings')
+    parser.add_argument('-L', action='store', dest='access_log', default=None, help='Structured access log file')
+    parser.add_argument('-H', action='store_true', dest='stream_probing',
+                        help='Probe served station streams in the background and rank dead stations last')
+    parser.add_argument('-k', action='store', dest='bucketing_threshold', type=int, default=0,
+                        help='Split lists longer than this into alphabetical buckets (0 disables)')
+    parser.add_argument('-R', action='store', dest='playable_url_refresh_interval', type=int, default=0,
+                        help='Re-resolve the stream URLs of popular stations every N seconds (0 disables)')
     parser.add_argument('-d', action='store_true', dest='debug', help='Enable debug logging')
     arguments = parser.parse_args()
     logging.info("YCast (%s) server starting", __version__)
@@ -23,7 +44,16 @@ def launch_server():
         logging.debug("Debug logging enabled")
     else:
         logging.getLogger('werkzeug').setLevel(logging.WARNING)
-    server.run(arguments.config, arguments.address, arguments.port)
+    if arguments.async_logging:
+        logs.enable_async_logging()
+    if arguments.access_log:
+        logs.enable_access_log(arguments.access_log)
+    server.run(arguments.config, arguments.address, arguments.port, compression=arguments.compression,
+               rate_limiting=arguments.rate_limiting, cache_backend=arguments.cache_backend,
+               request_profiling=arguments.request_profiling, stream_probing=arguments.stream_probing,
+               bucketing_threshold=arguments.bucketing_threshold, admin_token=arguments.admin_token,
+               playable_url_refresh_interval=arguments.playable_url_refresh_interval,
+               trusted_proxies=arguments.trusted_proxies)
 
 
 if __name__ == '__main__':
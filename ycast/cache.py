@@ -0,0 +1,263 @@
+import collections
+import hashlib
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+
+import ycast.generic as generic
+
+MEMORY_CACHE_SIZE = 20000
+SQLITE_CACHE_NAME = 'shared'
+SQLITE_PURGE_INTERVAL = 1000
+MEMCACHED_DEFAULT_PORT = 11211
+MEMCACHED_TIMEOUT = 1
+MEMCACHED_MAX_TTL = 30 * 24 * 3600
+MAX_KEY_LENGTH = 200
+
+
+class MemoryCache:
+    local = True
+
+    def __init__(self, max_size=MEMORY_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        values = {}
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if not entry:
+                    continue
+                if entry[1] and entry[1] <= now:
+                    del self.entries[key]
+                    continue
+                self.entries.move_to_end(key)
+                values[key] = entry[0]
+        return values
+
+    def set_many(self, values, ttl=0):
+        expires = time.time() + ttl if ttl else 0
+        with self.lock:
+            for key, value in values.items():
+                self.entries[key] = (value, expires)
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class SqliteCache:
+    local = False
+
+    def __init__(self, path):
+        self.path = path
+        self.connections = threading.local()
+        self.sets = 0
+        self._get_connection().execute('CREATE TABLE IF NOT EXISTS cache '
+                                       '(key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+
+    def _get_connection(self):
+        if not hasattr(self.connections, 'connection'):
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.connections.connection = connection
+        return self.connections.connection
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            rows = self._get_connection().execute(
+                'SELECT key, value FROM cache WHERE key IN (' + ','.join('?' * len(keys)) + ') '
+                'AND (expires = 0 OR expires > ?)', keys + [time.time()]).fetchall()
+        except sqlite3.Error as e:
+            logging.error("Could not read from SQLite cache '%s': %s", self.path, e)
+            return {}
+        return dict(rows)
+
+    def set_many(self, values, ttl=0):
+        expires = time.time() + ttl if ttl else 0
+        try:
+            connection = self._get_connection()
+            connection.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                                   [(key, value, expires) for key, value in values.items()])
+            self.sets += 1
+            if self.sets % SQLITE_PURGE_INTERVAL == 0:
+                connection.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (time.time(),))
+        except sqlite3.Error as e:
+            logging.error("Could not write to SQLite cache '%s': %s", self.path, e)
+
+    def delete(self, key):
+        try:
+            self._get_connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            logging.error("Could not delete from SQLite cache '%s': %s", self.path, e)
+
+
+class MemcachedCache:
+    """
+    Speaks the memcached text protocol, so any memcached compatible key-value store (memcached, Redis with a
+    memcached frontend, mcrouter, ...) can be shared between several YCast instances.
+    """
+    local = False
+
+    def __init__(self, host, port=MEMCACHED_DEFAULT_PORT, timeout=MEMCACHED_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connections = threading.local()
+
+    def _get_connection(self):
+        if not getattr(self.connections, 'file', None):
+            connection = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.connections.socket = connection
+            self.connections.file = connection.makefile('rwb')
+        return self.connections.file
+
+    def _close_connection(self):
+        try:
+            self.connections.file.close()
+            self.connections.socket.close()
+        except (AttributeError, OSError):
+            pass
+        self.connections.file = None
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = {}
+        try:
+            connection = self._get_connection()
+            connection.write(b'get ' + ' '.join(keys).encode() + b'\r\n')
+            connection.flush()
+            while True:
+                line = connection.readline()
+                if line == b'END\r\n':
+                    break
+                if not line.startswith(b'VALUE '):
+                    raise OSError("Unexpected response: " + repr(line))
+                key, flags, length = line.split()[1:4]
+                values[key.decode()] = connection.read(int(length) + 2)[:-2]
+        except (OSError, ValueError) as e:
+            logging.error("Could not read from memcached at %s:%s: %s", self.host, self.port, e)
+            self._close_connection()
+            return {}
+        return values
+
+    def set_many(self, values, ttl=0):
+        if not values:
+            return
+        try:
+            connection = self._get_connection()
+            for key, value in values.items():
+                connection.write(b'set ' + key.encode() + b' 0 ' + str(min(int(ttl), MEMCACHED_MAX_TTL)).encode() +
+                                 b' ' + str(len(value)).encode() + b'\r\n' + value + b'\r\n')
+            connection.flush()
+            for _ in values:
+                line = connection.readline()
+                if line != b'STORED\r\n':
+                    raise OSError("Unexpected response: " + repr(line))
+        except OSError as e:
+            logging.error("Could not write to memcached at %s:%s: %s", self.host, self.port, e)
+            self._close_connection()
+
+    def delete(self, key):
+        try:
+            connection = self._get_connection()
+            connection.write(b'delete ' + key.encode() + b'\r\n')
+            connection.flush()
+            connection.readline()
+        except OSError as e:
+            logging.error("Could not delete from memcached at %s:%s: %s", self.host, self.port, e)
+            self._close_connection()
+
+
+backend = MemoryCache()
+
+
+def set_backend(spec):
+    global backend
+    if not spec or spec == 'memory':
+        backend = MemoryCache()
+    elif spec == 'sqlite' or spec.startswith('sqlite:'):
+        path = spec[len('sqlite:'):]
+        if not path:
+            cache_path = generic.get_cache_path(SQLITE_CACHE_NAME)
+            if not cache_path:
+                return False
+            path = cache_path + '/cache.sqlite'
+        try:
+            backend = SqliteCache(path)
+        except sqlite3.Error as e:
+            logging.error("Could not open SQLite cache '%s': %s", path, e)
+            return False
+    elif spec.startswith('memcached://'):
+        host, _, port = spec[len('memcached://'):].partition(':')
+        try:
+            backend = MemcachedCache(host, int(port) if port else MEMCACHED_DEFAULT_PORT)
+        except ValueError:
+            logging.error("Invalid memcached port '%s'", port)
+            return False
+    else:
+        logging.error("Unknown cache backend '%s'", spec)
+        return False
+    logging.info("Using %s cache backend", type(backend).__name__)
+    return True
+
+
+def get_key(key):
+    # Keep keys short and free of whitespace and control characters, as networked key-value stores are picky about them
+    if len(key) > MAX_KEY_LENGTH or any(character <= ' ' or character >= '\x7f' for character in key):
+        return 'sha1:' + hashlib.sha1(key.encode()).hexdigest()
+    return key
+
+
+def get(key):
+    return get_many([key]).get(key)
+
+
+def get_many(keys):
+    backend_keys = {get_key(key): key for key in keys}
+    return {backend_keys[backend_key]: value for backend_key, value in backend.get_many(backend_keys).items()}
+
+
+def set(key, value, ttl=0):
+    set_many({key: value}, ttl)
+
+
+def set_many(values, ttl=0):
+    backend.set_many({get_key(key): value for key, value in values.items()}, ttl)
+
+
+def delete(key):
+    backend.delete(get_key(key))
+
+
+def get_json(key):
+    value = get(key)
+    if value is None:
+        return None
+    return json.loads(value.decode())
+
+
+def get_many_json(keys):
+    return {key: json.loads(value.decode()) for key, value in get_many(keys).items()}
+
+
+def set_json(key, value, ttl=0):
+    set(key, json.dumps(value).encode(), ttl)
+
+
+def set_many_json(values, ttl=0):
+    set_many({key: json.dumps(value).encode() for key, value in values.items()}, ttl)
@@ -1,6 +1,8 @@
 import base64
+import itertools
 import logging
 import os
+import unicodedata
 import uuid
 
 import yaml
@@ -79,3 +81,63 @@ def get_cache_path(cache_name):
 
 def get_country_name(code):
     return country_names.get(code.upper(), code.upper())
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(character for character in text if not unicodedata.combining(character))
+    return ' '.join(text.split())
+
+
+def get_bucket_key(name):
+    # Only letters, digits and spaces, as labels end up in URL paths
+    return ' '.join(''.join(character for character in normalize_text(name or '')
+                            if character.isalnum() or character == ' ').split())
+
+
+def get_bucket_key_prefix(key, length):
+    # A prefix ending in a space would look the same as the one before it
+    if key[length - 1:length] == ' ':
+        length += 1
+    return key[:length]
+
+
+def get_bucket_label(first_key, last_key, previous_key=None, next_key=None):
+    # Labels only get as long as needed to tell the bucket apart from its neighbours (e.g. 'Sa-Sm', 'Sn-T')
+    first_length = last_length = 1
+    if previous_key is not None:
+        first_length = last_length = len(os.path.commonprefix([first_key, previous_key])) + 1
+    if next_key is not None:
+        last_length = len(os.path.commonprefix([last_key, next_key])) + 1
+        if previous_key is None:
+            first_length = last_length
+    first_label = get_bucket_key_prefix(first_key, first_length)
+    last_label = get_bucket_key_prefix(last_key, max(last_length, len(first_label)))
+    if first_label == last_label:
+        return first_label.title() or '#'
+    return (first_label.title() or '#') + '-' + last_label.title()
+
+
+def get_bucket_index(names, target_size):
+    keys = [get_bucket_key(name) for name in names]
+    positions = sorted(range(len(keys)), key=lambda position: keys[position])
+    chunks = []
+    for _, group in itertools.groupby(positions, key=lambda position: keys[position][:1]):
+        group = list(group)
+        if chunks and len(chunks[-1]) + len(group) <= target_size:
+            # Merge sparse neighbouring letters
+            chunks[-1].extend(group)
+            continue
+        while group:
+            # Split crowded letters, but never between equal names as no label could tell them apart
+            end = min(target_size, len(group))
+            while end < len(group) and keys[group[end]] == keys[group[end - 1]]:
+                end += 1
+            chunks.append(group[:end])
+            group = group[end:]
+    buckets = []
+    for index, chunk in enumerate(chunks):
+        previous_key = keys[chunks[index - 1][-1]] if index > 0 else None
+        next_key = keys[chunks[index + 1][0]] if index + 1 < len(chunks) else None
+        buckets.append([get_bucket_label(keys[chunk[0]], keys[chunk[-1]], previous_key, next_key), chunk])
+    return buckets
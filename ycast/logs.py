@@ -0,0 +1,91 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+DEDUPLICATION_INTERVAL = 60
+DEDUPLICATION_BURST = 5
+DEDUPLICATION_SIZE = 1000
+ACCESS_LOGGER_NAME = 'ycast.access'
+
+access_log_enabled = False
+access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
+
+
+class DeduplicationFilter(logging.Filter):
+    """
+    Lets through only a few warnings (or worse) of the same kind per interval.
+    The first one let through after a suppressed streak reports how many were dropped.
+    """
+    def __init__(self, interval=DEDUPLICATION_INTERVAL, burst=DEDUPLICATION_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.streaks = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            streak = self.streaks.get(key)
+            if not streak or now - streak['start'] >= self.interval:
+                suppressed = streak['suppressed'] if streak else 0
+                if len(self.streaks) >= DEDUPLICATION_SIZE:
+                    self.streaks.clear()
+                self.streaks[key] = {'start': now, 'count': 1, 'suppressed': 0}
+            else:
+                streak['count'] += 1
+                if streak['count'] > self.burst:
+                    streak['suppressed'] += 1
+                    return False
+                suppressed = 0
+        if suppressed:
+            record.msg = record.getMessage() + ' (' + str(suppressed) + ' similar messages suppressed)'
+            record.args = None
+        return True
+
+
+def start_listener(logger, handlers, log_filter=None):
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if log_filter:
+        queue_handler.addFilter(log_filter)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+
+def enable_async_logging():
+    root_logger = logging.getLogger()
+    # Hand the slow part (formatting into files and terminals) over to a background thread
+    start_listener(root_logger, list(root_logger.handlers), DeduplicationFilter())
+    logging.debug("Asynchronous logging enabled")
+
+
+def enable_access_log(path):
+    global access_log_enabled
+    try:
+        handler = logging.FileHandler(path)
+    except OSError as e:
+        logging.error("Could not open access log file '%s': %s", path, e)
+        return False
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    access_logger.propagate = False
+    access_logger.setLevel(logging.INFO)
+    start_listener(access_logger, [handler])
+    access_log_enabled = True
+    logging.info("Writing access log to '%s'", path)
+    return True
+
+
+def log_access(entry):
+    access_logger.info(json.dumps(entry))
@@ -1,6 +1,7 @@
 import base64
 import hashlib
 import logging
+import os
 
 import yaml
 
@@ -10,6 +11,8 @@ import ycast.generic as generic
 ID_PREFIX = 'MY'
 
 config_file = 'stations.yml'
+stations_yaml = None
+stations_yaml_mtime = None
 
 
 class Station:
@@ -46,6 +49,13 @@ def get_station_by_id(id):
 
 
 def get_stations_yaml():
+    global stations_yaml, stations_yaml_mtime
+    try:
+        mtime = os.stat(config_file).st_mtime
+    except OSError:
+        mtime = None
+    if mtime and mtime == stations_yaml_mtime:
+        return stations_yaml
     try:
         with open(config_file, 'r') as f:
             my_stations = yaml.safe_load(f)
@@ -58,6 +68,8 @@ def get_stations_yaml():
     except yaml.YAMLError as e:
         logging.error("Station configuration file format error: %s", e)
         return None
+    stations_yaml = my_stations
+    stations_yaml_mtime = mtime
     return my_stations
 
 
@@ -66,7 +78,7 @@ def get_category_directories():
     categories = []
     if my_stations_yaml:
         for category in my_stations_yaml:
-            categories.append(generic.Directory(category, len(get_stations_by_category(category))))
+            categories.append(generic.Directory(category, len(my_stations_yaml[category] or [])))
     return categories
 
 
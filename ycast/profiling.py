@@ -0,0 +1,156 @@
+import collections
+import contextlib
+import cProfile
+import hmac
+import io
+import logging
+import pstats
+import random
+import sys
+import threading
+import time
+import traceback
+
+PROFILE_HEADER = 'X-YCast-Profile'
+ADMIN_TOKEN_HEADER = 'X-YCast-Admin-Token'
+ADMIN_ADDRESSES = ('127.0.0.1', '::1')
+PROXY_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+SAMPLE_RATE = 0.0
+SLOW_REQUEST_THRESHOLD = 1.0
+STACK_SAMPLE_INTERVAL = 0.05
+MAX_STACKS = 200
+PROFILE_STATS_LINES = 40
+RECORDS_SIZE = 100
+
+enabled = False
+admin_token = None
+records = collections.deque(maxlen=RECORDS_SIZE)
+active_requests = {}
+active_requests_lock = threading.Lock()
+profiler_lock = threading.Lock()
+profile_next = 0
+profile_next_lock = threading.Lock()
+context = threading.local()
+
+
+class RequestProfile:
+    def __init__(self, method, path, profile):
+        self.method = method
+        self.path = path
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.timings = collections.defaultdict(float)
+        self.stacks = collections.Counter()
+        self.profiler = None
+        # Only one cProfile profiler can be active per process
+        if profile and profiler_lock.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def get_duration(self):
+        return time.perf_counter() - self.start
+
+    def get_profile_stats(self):
+        self.profiler.disable()
+        profiler_lock.release()
+        stats_file = io.StringIO()
+        pstats.Stats(self.profiler, stream=stats_file).sort_stats('cumulative').print_stats(PROFILE_STATS_LINES)
+        return stats_file.getvalue()
+
+
+def start(sample_interval=STACK_SAMPLE_INTERVAL, token=None):
+    global enabled, admin_token
+    enabled = True
+    admin_token = token
+    threading.Thread(target=_sample_stacks, args=(sample_interval,), name='stack-sampler', daemon=True).start()
+    logging.info("Request profiling enabled (slow request threshold: %s seconds)", SLOW_REQUEST_THRESHOLD)
+
+
+def is_admin(address, token=None, proxied=False):
+    # Profiles are expensive and reveal what other clients requested, so only the operator may ask for them.
+    # Behind a reverse proxy every client comes from a local address, so proxied requests need the token.
+    if address in ADMIN_ADDRESSES and not proxied:
+        return True
+    return bool(admin_token and token and hmac.compare_digest(token.encode(), admin_token.encode()))
+
+
+def profile_next_requests(count):
+    global profile_next
+    with profile_next_lock:
+        profile_next = count
+
+
+def start_request(method, path, profile=False):
+    global profile_next
+    if not enabled:
+        return
+    if not profile and profile_next > 0:
+        with profile_next_lock:
+            if profile_next > 0:
+                profile_next -= 1
+                profile = True
+    if not profile and SAMPLE_RATE and random.random() < SAMPLE_RATE:
+        profile = True
+    context.request_profile = RequestProfile(method, path, profile)
+    with active_requests_lock:
+        active_requests[threading.get_ident()] = context.request_profile
+
+
+def finish_request(status):
+    request_profile = getattr(context, 'request_profile', None)
+    if not request_profile:
+        return None
+    context.request_profile = None
+    with active_requests_lock:
+        active_requests.pop(threading.get_ident(), None)
+    duration = request_profile.get_duration()
+    record = {
+        'timestamp': request_profile.timestamp,
+        'method': request_profile.method,
+        'path': request_profile.path,
+        'status': status,
+        'duration': duration,
+        'timings': dict(request_profile.timings)
+    }
+    if request_profile.profiler:
+        record['profile'] = request_profile.get_profile_stats()
+    if duration >= SLOW_REQUEST_THRESHOLD:
+        logging.warning("Slow request (%.3f seconds): %s %s", duration, request_profile.method, request_profile.path)
+        record['stacks'] = dict(request_profile.stacks.most_common(MAX_STACKS))
+    records.append(record)
+    return record
+
+
+def get_records():
+    return list(records)
+
+
+@contextlib.contextmanager
+def timed(section):
+    request_profile = getattr(context, 'request_profile', None)
+    if not request_profile:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_profile.timings[section] += time.perf_counter() - start_time
+
+
+def _sample_stacks(interval):
+    # Sample every active request, only the ones which end up slow keep their samples
+    while True:
+        time.sleep(interval)
+        with active_requests_lock:
+            requests = list(active_requests.items())
+        if not requests:
+            continue
+        frames = sys._current_frames()
+        for thread_id, request_profile in requests:
+            if thread_id not in frames:
+                continue
+            stack = ';'.join(frame.name + ' (' + frame.filename + ':' + str(frame.lineno) + ')'
+                             for frame in traceback.extract_stack(frames[thread_id]))
+            if stack in request_profile.stacks or len(request_profile.stacks) < MAX_STACKS:
+                request_profile.stacks[stack] += 1
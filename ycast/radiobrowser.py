@@ -1,9 +1,19 @@
-import requests
+import concurrent.futures
+import contextlib
+import hashlib
+import json
 import logging
+import threading
+import time
+
+import requests
 
 from ycast import __version__
 import ycast.vtuner as vtuner
 import ycast.generic as generic
+import ycast.cache as cache
+import ycast.profiling as profiling
+import ycast.stream_health as stream_health
 
 API_ENDPOINT = 'http://127.0.0.1:8002'
 MINIMUM_COUNT_COUNTRY = 5
@@ -12,6 +22,19 @@ MINIMUM_COUNT_GENRE = 50
 DEFAULT_STATION_LIMIT = 200
 SHOW_BROKEN_STATIONS = False
 ID_PREFIX = 'RB'
+PLAYABLE_URL_CACHE_TTL = 600
+PLAYABLE_URL_HITS_SIZE = 1000
+PLAYABLE_URL_REFRESH_INTERVAL = 0
+PLAYABLE_URL_REFRESH_MIN_HITS = 3
+STATION_CACHE_TTL = 600
+STATION_BATCH_SIZE = 100
+DIRECTORY_CACHE_TTL = 3600
+DIRECTORY_REFRESH_INTERVAL = 2700
+SEARCH_CACHE_TTL = 600
+
+playable_url_hits = {}
+playable_url_hits_lock = threading.Lock()
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
 
 
 class Station:
@@ -20,6 +43,7 @@ class Station:
         self.id = generic.generate_stationid_with_prefix(generic.b64encode_uuid(self.uuid), ID_PREFIX)
         self.name = station_json.get('name')
         self.url = station_json.get('url')
+        self.url_resolved = station_json.get('url_resolved')
         self.icon = station_json.get('favicon')
         try:
             self.tags = [tag.capitalize() for tag in station_json['tags'].split(',')]
@@ -42,43 +66,249 @@ class Station:
                               genre=self.tags[0], location=self.countrycode, mime=self.codec, bitrate=self.bitrate)
 
     def get_playable_url(self):
-        try:
-            playable_url_json = request('url/' + self.uuid)
-            self.url = playable_url_json['url']
-        except KeyError:
-            logging.error("Could not retrieve first playlist item for station with ID '%s'", self.id)
+        playable_url = resolve_playable_url(self.uuid)
+        if playable_url:
+            self.url = playable_url
 
 
 def request(url):
     logging.debug("Radiobrowser API request: %s", url)
     headers = {'Content-Type': 'application/json', 'User-Agent': generic.USER_AGENT + '/' + __version__}
+    with profiling.timed('upstream'):
+        try:
+            response = requests.get(API_ENDPOINT + '/json/' + url, headers=headers)
+        except requests.exceptions.ConnectionError as e:
+            logging.error("Connection to Radiobrowser API failed: %s", e)
+            return {}
+        if response.status_code != 200:
+            logging.error("Could not fetch data from Radiobrowser API (HTTP status %s)", response.status_code)
+            return {}
+        return response.json()
+
+
+def get_cached_playable_url(uuid):
+    playable_url = cache.get_json('playable_url:' + uuid)
+    if playable_url:
+        with playable_url_hits_lock:
+            playable_url_hits.setdefault(uuid, {'hits': 0, 'timestamp': time.time()})['hits'] += 1
+    return playable_url
+
+
+def resolve_playable_url(uuid, use_cache=True):
+    if use_cache:
+        playable_url = get_cached_playable_url(uuid)
+        if playable_url:
+            return playable_url
+    playable_url_json = request('url/' + uuid)
     try:
-        response = requests.get(API_ENDPOINT + '/json/' + url, headers=headers)
-    except requests.exceptions.ConnectionError as e:
-        logging.error("Connection to Radiobrowser API failed: %s", e)
-        return {}
-    if response.status_code != 200:
-        logging.error("Could not fetch data from Radiobrowser API (HTTP status %s)", response.status_code)
-        return {}
-    return response.json()
-
-
-def get_station_by_id(id):
-    station_json = request('stations/byuuid/' + generic.b64decode_uuid(str(id)))
-    if station_json and len(station_json):
-        return Station(station_json[0])
-    else:
+        playable_url = playable_url_json['url']
+    except (KeyError, TypeError):
+        logging.error("Could not retrieve first playlist item for station with UUID '%s'", uuid)
         return None
+    cache.set_json('playable_url:' + uuid, playable_url, PLAYABLE_URL_CACHE_TTL)
+    with playable_url_hits_lock:
+        hits = playable_url_hits[uuid]['hits'] if uuid in playable_url_hits else 0
+        playable_url_hits[uuid] = {'hits': hits + int(use_cache), 'timestamp': time.time()}
+        if len(playable_url_hits) > PLAYABLE_URL_HITS_SIZE:
+            _purge_playable_url_hits()
+    return playable_url
 
 
-def search(name, limit=DEFAULT_STATION_LIMIT):
-    apicall = 'stations/search?name=' + requests.utils.quote(name, safe='') + '&hidebroken=' + \
-              str(not SHOW_BROKEN_STATIONS).lower() + '&order=name&reverse=false&limit=' + str(limit)
-    stations_json = request(apicall)
-    return [Station(station_json) for station_json in stations_json]
+def _purge_playable_url_hits():
+    now = time.time()
+    for uuid in [uuid for uuid, resolved in playable_url_hits.items()
+                 if now - resolved['timestamp'] >= PLAYABLE_URL_CACHE_TTL]:
+        del playable_url_hits[uuid]
+    if len(playable_url_hits) > PLAYABLE_URL_HITS_SIZE:
+        # Still full of fresh entries, drop the least popular ones
+        by_hits = sorted(playable_url_hits, key=lambda uuid: playable_url_hits[uuid]['hits'])
+        for uuid in by_hits[:len(playable_url_hits) - PLAYABLE_URL_HITS_SIZE]:
+            del playable_url_hits[uuid]
+
+
+def _refresh_playable_urls(interval):
+    while True:
+        time.sleep(interval)
+        now = time.time()
+        with playable_url_hits_lock:
+            _purge_playable_url_hits()
+            # Re-resolve popular stations before their entry expires and reset their popularity for the next round
+            popular = [uuid for uuid, resolved in playable_url_hits.items()
+                       if resolved['hits'] >= PLAYABLE_URL_REFRESH_MIN_HITS and
+                       now - resolved['timestamp'] >= PLAYABLE_URL_CACHE_TTL - interval]
+            for uuid in popular:
+                playable_url_hits[uuid]['hits'] = 0
+        for uuid in popular:
+            logging.debug("Refreshing playable URL of popular station with UUID '%s'", uuid)
+            resolve_playable_url(uuid, use_cache=False)
+        # Revalidate the cached station data of all popular stations at once
+        get_stations_by_uuid(popular, use_cache=False)
+
+
+def start_playable_url_refresher(interval=PLAYABLE_URL_REFRESH_INTERVAL):
+    if interval <= 0:
+        return False
+    threading.Thread(target=_refresh_playable_urls, args=(interval,), name='playable-url-refresher',
+                     daemon=True).start()
+    logging.info("Refreshing playable URLs of popular stations every %s seconds", interval)
+    return True
+
+
+def get_cached_playable_url_by_id(id):
+    uuid = generic.b64decode_uuid(str(id))
+    if not uuid:
+        return None
+    return get_cached_playable_url(uuid)
+
+
+def get_playable_url_by_id(id):
+    uuid = generic.b64decode_uuid(str(id))
+    if not uuid:
+        return None
+    return resolve_playable_url(uuid)
+
+
+def get_station_by_id(id, resolve_url=False):
+    uuid = generic.b64decode_uuid(str(id))
+    if not uuid:
+        return None
+    if resolve_url:
+        # Resolve the playable URL alongside the station lookup instead of after it
+        playable_url = executor.submit(resolve_playable_url, uuid)
+    station_json = cache.get_json('station:' + uuid)
+    if not station_json:
+        stations_json = request('stations/byuuid/' + uuid)
+        if not stations_json or not len(stations_json):
+            return None
+        station_json = stations_json[0]
+        _cache_stations_json([station_json])
+    station = Station(station_json)
+    if resolve_url and playable_url.result():
+        station.url = playable_url.result()
+    return station
+
+
+def get_stations_by_uuid(uuids, use_cache=True):
+    stations_json = {}
+    if use_cache:
+        stations_json = {key[len('station:'):]: station_json for key, station_json in
+                         cache.get_many_json(['station:' + uuid for uuid in uuids]).items()}
+    missing_uuids = []
+    for uuid in uuids:
+        if uuid not in stations_json and uuid not in missing_uuids:
+            missing_uuids.append(uuid)
+    for i in range(0, len(missing_uuids), STATION_BATCH_SIZE):
+        chunk = missing_uuids[i:i + STATION_BATCH_SIZE]
+        chunk_json = request('stations/byuuid?uuids=' + ','.join(chunk))
+        _cache_stations_json(chunk_json)
+        for station_json in chunk_json:
+            stations_json[station_json.get('stationuuid')] = station_json
+    with profiling.timed('station'):
+        return [Station(stations_json[uuid]) for uuid in uuids if uuid in stations_json]
+
+
+def _cache_stations_json(stations_json):
+    cache.set_many_json({'station:' + station_json['stationuuid']: station_json for station_json in stations_json
+                         if station_json.get('stationuuid')}, STATION_CACHE_TTL)
+
+
+def search(name, limit=DEFAULT_STATION_LIMIT, upstream_context=contextlib.nullcontext):
+    query = generic.normalize_text(name)
+    # A complete result set of a shorter query already holds every match of a query extending it
+    keys = ['search:' + str(limit) + ':' + query[:length] for length in range(len(query), 0, -1)]
+    cached = cache.get_many_json(keys)
+    if keys and keys[0] in cached:
+        stations_json = cached[keys[0]]
+    else:
+        stations_json = None
+        for key in keys[1:]:
+            if key in cached and len(cached[key]) < limit:
+                stations_json = [station_json for station_json in cached[key]
+                                 if query in generic.normalize_text(station_json.get('name') or '')]
+                break
+        if stations_json is None:
+            apicall = 'stations/search?name=' + requests.utils.quote(' '.join(name.split()), safe='') + \
+                      '&hidebroken=' + str(not SHOW_BROKEN_STATIONS).lower() + '&order=name&reverse=false&limit=' + \
+                      str(limit)
+            # Only requests which actually reach the API are run in the given context (e.g. rate limited)
+            with upstream_context():
+                stations_json = request(apicall)
+            if not isinstance(stations_json, list):
+                # Failed requests are not worth caching
+                return []
+            _cache_stations_json(stations_json)
+        if keys:
+            cache.set_json(keys[0], stations_json, SEARCH_CACHE_TTL)
+    with profiling.timed('station'):
+        stations = [Station(station_json) for station_json in stations_json]
+    return stream_health.apply(stations, 'search:' + str(limit) + ':' + query)
+
+
+def _get_directories_key(kind, threshold):
+    return 'directories:' + kind + ':' + str(threshold) + ':' + str(SHOW_BROKEN_STATIONS)
+
+
+def _cache_directories(kind, threshold, directories):
+    # The summary (count and signature) lets pages be checked without decoding the whole list
+    directories_json = [[directory.name, directory.item_count, directory.displayname] for directory in directories]
+    summary = {'count': len(directories), 'signature': hashlib.sha1(json.dumps(directories_json).encode()).hexdigest()}
+    cache.set_many_json({_get_directories_key(kind, threshold): directories_json,
+                         _get_directories_key(kind, threshold) + ':summary': summary}, DIRECTORY_CACHE_TTL)
+    return summary
+
+
+def _get_directories(kind, threshold):
+    directories_json = cache.get_json(_get_directories_key(kind, threshold))
+    if directories_json is not None:
+        return [generic.Directory(*directory_json) for directory_json in directories_json]
+    directories = directory_builders[kind](threshold)
+    if directories:
+        _cache_directories(kind, threshold, directories)
+    return directories
+
+
+def get_directories_summaries(thresholds):
+    keys = {kind: _get_directories_key(kind, threshold) + ':summary' for kind, threshold in thresholds.items()}
+    cached = cache.get_many_json(keys.values())
+    summaries = {}
+    for kind, key in keys.items():
+        if key in cached:
+            summaries[kind] = cached[key]
+            continue
+        # Cache entries are evicted independently, the list itself may still be cached
+        directories = _get_directories(kind, thresholds[kind])
+        if directories:
+            summaries[kind] = _cache_directories(kind, thresholds[kind], directories)
+        else:
+            summaries[kind] = {'count': 0, 'signature': None}
+    return summaries
 
 
 def get_country_directories(threshold=MINIMUM_COUNT_COUNTRY):
+    return _get_directories('country', threshold)
+
+
+def get_language_directories(threshold=MINIMUM_COUNT_LANGUAGE):
+    return _get_directories('language', threshold)
+
+
+def get_genre_directories(threshold=MINIMUM_COUNT_GENRE):
+    return _get_directories('genre', threshold)
+
+
+def get_country_directories_summary(threshold=MINIMUM_COUNT_COUNTRY):
+    return get_directories_summaries({'country': threshold})['country']
+
+
+def get_language_directories_summary(threshold=MINIMUM_COUNT_LANGUAGE):
+    return get_directories_summaries({'language': threshold})['language']
+
+
+def get_genre_directories_summary(threshold=MINIMUM_COUNT_GENRE):
+    return get_directories_summaries({'genre': threshold})['genre']
+
+
+def _build_country_directories(threshold):
     country_directories = []
     apicall = 'countries?hidebroken=' + str(not SHOW_BROKEN_STATIONS).lower()
     countries_raw = request(apicall)
@@ -96,7 +326,7 @@ def get_country_directories(threshold=MINIMUM_COUNT_COUNTRY):
     return country_directories
 
 
-def get_language_directories(threshold=MINIMUM_COUNT_LANGUAGE):
+def _build_language_directories(threshold):
     language_directories = []
     apicall = 'languages?hidebroken=' + str(not SHOW_BROKEN_STATIONS).lower() + '&order=name&reverse=false'
     languages_raw = request(apicall)
@@ -108,7 +338,7 @@ def get_language_directories(threshold=MINIMUM_COUNT_LANGUAGE):
     return language_directories
 
 
-def get_genre_directories(threshold=MINIMUM_COUNT_GENRE):
+def _build_genre_directories(threshold):
     genre_directories = []
     apicall = 'tags?hidebroken=' + str(not SHOW_BROKEN_STATIONS).lower() + '&order=name&reverse=false'
     genres_raw = request(apicall)
@@ -120,13 +350,44 @@ def get_genre_directories(threshold=MINIMUM_COUNT_GENRE):
     return genre_directories
 
 
+directory_builders = {
+    'country': _build_country_directories,
+    'language': _build_language_directories,
+    'genre': _build_genre_directories
+}
+
+
+def _refresh_directories(interval):
+    thresholds = {'country': MINIMUM_COUNT_COUNTRY, 'language': MINIMUM_COUNT_LANGUAGE, 'genre': MINIMUM_COUNT_GENRE}
+    while True:
+        # Rebuild the directories before their cache entries expire, so no AVR has to wait for the full tables
+        for kind, threshold in thresholds.items():
+            directories = directory_builders[kind](threshold)
+            if directories:
+                _cache_directories(kind, threshold, directories)
+            else:
+                logging.error("Could not refresh %s directories", kind)
+        time.sleep(interval)
+
+
+def start_directory_refresher(interval=DIRECTORY_REFRESH_INTERVAL):
+    if interval <= 0:
+        return False
+    threading.Thread(target=_refresh_directories, args=(interval,), name='directory-refresher', daemon=True).start()
+    logging.info("Refreshing Radiobrowser directories every %s seconds", interval)
+    return True
+
+
 def _get_stations(key, value, args=None):
     apicall = 'stations/' + key + '/' + requests.utils.quote(str(value), safe='') + \
               '?hidebroken=' + str(not SHOW_BROKEN_STATIONS).lower()
     if args:
         apicall += '&' + args
     stations_json = request(apicall)
-    return [Station(station_json) for station_json in stations_json]
+    _cache_stations_json(stations_json)
+    with profiling.timed('station'):
+        stations = [Station(station_json) for station_json in stations_json]
+    return stream_health.apply(stations, apicall)
 
 
 def get_stations_by_country(country):
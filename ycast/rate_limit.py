@@ -0,0 +1,124 @@
+import contextlib
+import logging
+import threading
+import time
+
+# Rate (per second) and burst of every kind of expensive request. Each kind has its own budget per client, so
+# e.g. loading the logos of a list page never keeps the same AVR from playing a station.
+LIMITS = {
+    'play': (0.5, 10),
+    'search': (0.2, 5),
+    'icon': (2, 50)
+}
+MAX_CLIENTS = 1000
+MAX_CLIENTS_PER_ADDRESS = 8
+MAX_JOBS = 4
+MAX_JOBS_PER_CLIENT = 1
+JOB_QUEUE_TIMEOUT = 30
+
+enabled = False
+buckets = {}
+address_clients = {}
+buckets_lock = threading.Lock()
+jobs_condition = threading.Condition()
+jobs_queue = []
+jobs_running = {}
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.timestamp = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def consume(self):
+        self.refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def get_client(address, mac=None):
+    # The mac parameter is chosen by the client, so it may only tell apart a few clients behind the same address
+    if not enabled or not mac:
+        return address
+    with buckets_lock:
+        macs = address_clients.setdefault(address, set())
+        if mac not in macs:
+            if len(macs) >= MAX_CLIENTS_PER_ADDRESS:
+                return address
+            macs.add(mac)
+    return address + '/' + mac
+
+
+def allow(client, kind):
+    if not enabled:
+        return True
+    with buckets_lock:
+        if (kind, client) not in buckets:
+            if len(buckets) >= MAX_CLIENTS:
+                _purge_buckets()
+            buckets[(kind, client)] = TokenBucket(*LIMITS[kind])
+        return buckets[(kind, client)].consume()
+
+
+def _purge_buckets():
+    # Buckets which refilled completely carry no state worth keeping
+    for key in list(buckets):
+        buckets[key].refill()
+        if buckets[key].tokens >= buckets[key].burst:
+            del buckets[key]
+    # Clients without any bucket left make room for other clients behind the same address
+    clients = {client for _, client in buckets}
+    for address in list(address_clients):
+        address_clients[address] = {mac for mac in address_clients[address] if address + '/' + mac in clients}
+        if not address_clients[address]:
+            del address_clients[address]
+
+
+def _is_next_job(ticket):
+    if sum(jobs_running.values()) >= MAX_JOBS:
+        return False
+    # First come, first served among the clients which have not used up their share of job slots
+    for queued_ticket in jobs_queue:
+        if jobs_running.get(queued_ticket[1], 0) < MAX_JOBS_PER_CLIENT:
+            return queued_ticket is ticket
+    return False
+
+
+@contextlib.contextmanager
+def job(client, kind):
+    # Yields whether the job got a slot, jobs which waited too long must not run anymore
+    if not enabled:
+        yield True
+        return
+    # Jobs of different kinds do not wait for each other's slots of the same client
+    key = (kind, client)
+    ticket = (object(), key)
+    with jobs_condition:
+        jobs_queue.append(ticket)
+        admitted = jobs_condition.wait_for(lambda: _is_next_job(ticket), timeout=JOB_QUEUE_TIMEOUT)
+        jobs_queue.remove(ticket)
+        if admitted:
+            jobs_running[key] = jobs_running.get(key, 0) + 1
+        jobs_condition.notify_all()
+    if not admitted:
+        logging.warning("%s job of client '%s' waited more than %s seconds for a free slot", kind.capitalize(), client,
+                        JOB_QUEUE_TIMEOUT)
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        with jobs_condition:
+            jobs_running[key] -= 1
+            if not jobs_running[key]:
+                del jobs_running[key]
+            jobs_condition.notify_all()
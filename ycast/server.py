@@ -1,13 +1,24 @@
+import contextlib
+import gzip
+import hashlib
 import logging
 import re
+import time
+import zlib
 
-from flask import Flask, Response, abort, redirect, request, url_for
+from flask import Flask, Response, abort, g, jsonify, redirect, request, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 import ycast.vtuner as vtuner
 import ycast.radiobrowser as radiobrowser
 import ycast.my_stations as my_stations
 import ycast.generic as generic
 import ycast.station_icons as station_icons
+import ycast.rate_limit as rate_limit
+import ycast.cache as cache
+import ycast.profiling as profiling
+import ycast.logs as logs
+import ycast.stream_health as stream_health
 
 
 PATH_ROOT = 'ycast'
@@ -21,15 +32,44 @@ PATH_RADIOBROWSER_COUNTRY = 'country'
 PATH_RADIOBROWSER_LANGUAGE = 'language'
 PATH_RADIOBROWSER_GENRE = 'genre'
 PATH_RADIOBROWSER_POPULAR = 'popular'
+PATH_PROFILING = 'profiling'
+PATH_BUCKET = 'bucket'
+
+PAGE_CACHE_TTL = 3600
+BUCKET_TARGET_SIZE = 40
+BUCKET_CACHE_TTL = 3600
+COMPRESSION_MIN_SIZE = 512
+# User-Agent substrings of clients allowed to receive compressed responses (None allows every client)
+COMPRESSION_USER_AGENTS = None
+VTUNER_HOST_PATTERN = re.compile(r'^[A-Za-z0-9]+\.vtuner\.com$')
 
 station_tracking = True
 my_stations_enabled = False
+compression_enabled = False
+bucket_threshold = 0
+compression_bytes_saved = 0
 app = Flask(__name__)
 Response.default_mimetype = 'text/xml'
 
 
-def run(config, address='0.0.0.0', port=80):
+def run(config, address='0.0.0.0', port=80, compression=False, rate_limiting=False, cache_backend=None,
+        request_profiling=False, stream_probing=False, bucketing_threshold=0, admin_token=None,
+        playable_url_refresh_interval=0, trusted_proxies=0):
+    global compression_enabled, bucket_threshold
+    compression_enabled = compression
+    bucket_threshold = bucketing_threshold
+    rate_limit.enabled = rate_limiting
+    if trusted_proxies:
+        # Otherwise every client behind a reverse proxy shows up with the address of the proxy
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
+    if cache_backend and not cache.set_backend(cache_backend):
+        logging.error("Falling back to in-memory cache")
+    if request_profiling:
+        profiling.start(token=admin_token)
+    stream_health.enabled = stream_probing
     check_my_stations_feature(config)
+    radiobrowser.start_playable_url_refresher(playable_url_refresh_interval)
+    radiobrowser.start_directory_refresher()
     try:
         app.run(host=address, port=port)
     except PermissionError:
@@ -41,6 +81,155 @@ def check_my_stations_feature(config):
     my_stations_enabled = my_stations.set_config(config)
 
 
+@app.before_request
+def start_request_profiling():
+    if profiling.enabled:
+        profiling.start_request(request.method, request.full_path,
+                                profile=profiling.PROFILE_HEADER in request.headers and is_profiling_admin())
+
+
+def is_profiling_admin():
+    return profiling.is_admin(request.remote_addr, request.headers.get(profiling.ADMIN_TOKEN_HEADER),
+                              proxied=any(header in request.headers for header in profiling.PROXY_HEADERS))
+
+
+# Registered before any other after_request function so that it runs last and covers them as well
+@app.after_request
+def finish_request_profiling(response):
+    profiling.finish_request(response.status_code)
+    return response
+
+
+@app.teardown_request
+def abort_request_profiling(exception):
+    # Only still active if the request failed with an unhandled exception
+    profiling.finish_request(500)
+
+
+@app.before_request
+def start_access_log():
+    if logs.access_log_enabled:
+        g.request_start = time.perf_counter()
+
+
+@app.after_request
+def write_access_log(response):
+    if logs.access_log_enabled and 'request_start' in g:
+        logs.log_access({
+            'timestamp': time.time(),
+            'client': request.remote_addr,
+            'mac': request.args.get('mac'),
+            'method': request.method,
+            'host': request.host,
+            'path': request.full_path,
+            'status': response.status_code,
+            'size': response.calculate_content_length(),
+            'duration': time.perf_counter() - g.request_start
+        })
+    return response
+
+
+def get_client_id():
+    return rate_limit.get_client(request.remote_addr, request.args.get('mac'))
+
+
+def check_rate_limit(kind):
+    client = get_client_id()
+    if not rate_limit.allow(client, kind):
+        logging.warning("Rate limit for %s requests exceeded by client '%s'", kind, client)
+        abort(429)
+    return client
+
+
+@contextlib.contextmanager
+def rate_limited_job(kind):
+    client = check_rate_limit(kind)
+    with rate_limit.job(client, kind) as admitted:
+        if not admitted:
+            abort(503)
+        yield
+
+
+def get_paging_args():
+    return tuple(request.args.get(arg) for arg in ('startitems', 'startItems', 'start',
+                                                     'enditems', 'endItems', 'howmany'))
+
+
+def get_directories_signature(directories):
+    return tuple((directory.name, directory.item_count) for directory in directories)
+
+
+def get_cached_page(name, signature, build_page):
+    # Pages hold absolute URLs, so they are cached per host as well as per paging window
+    cache_key = 'page:' + hashlib.sha1(repr((name, request.host_url, get_paging_args(),
+                                             signature)).encode()).hexdigest()
+    # Lets the response compression keep the compressed page next to it
+    g.page_cache_key = cache_key
+    page_string = cache.get(cache_key)
+    if page_string:
+        return page_string.decode()
+    page_string = build_page().to_string()
+    cache.set(cache_key, page_string.encode(), PAGE_CACHE_TTL)
+    return page_string
+
+
+def get_bucket_index(items, get_name, signature=None):
+    if not bucket_threshold or len(items) <= bucket_threshold:
+        return None
+    names = [get_name(item) or '' for item in items]
+    if not signature:
+        signature = hashlib.sha1('\n'.join(names).encode()).hexdigest()
+    cache_key = 'buckets:' + str(BUCKET_TARGET_SIZE) + ':' + signature
+    bucket_index = cache.get_json(cache_key)
+    if bucket_index is None:
+        bucket_index = generic.get_bucket_index(names, BUCKET_TARGET_SIZE)
+        cache.set_json(cache_key, bucket_index, BUCKET_CACHE_TTL)
+    if len(bucket_index) < 2:
+        # A single bucket would only add another menu level
+        return None
+    return bucket_index
+
+
+def get_bucket_items(items, bucket_index, bucket):
+    for label, positions in bucket_index or []:
+        if label == bucket:
+            return [items[position] for position in positions]
+    logging.error("Unknown bucket '%s'", bucket)
+    abort(404)
+
+
+def get_buckets_page(endpoint, bucket_index, **values):
+    page = vtuner.Page()
+    for label, positions in get_paged_elements(bucket_index):
+        with profiling.timed('url_for'):
+            bucket_url = url_for(endpoint, bucket=label, _external=True, **values)
+        page.add(vtuner.Directory(label, bucket_url, len(positions)))
+    page.set_count(len(bucket_index))
+    return page
+
+
+def get_cached_directories_page(subdir, signature, count, get_directories, endpoint=None, bucket=None):
+    # The directories are only fetched if the page for this signature is not cached yet
+    if endpoint and bucket_threshold and count > bucket_threshold:
+        def get_directories_bucket_index(directories):
+            return get_bucket_index(directories, lambda directory: directory.displayname, signature)
+        if not bucket:
+            def get_index_page():
+                directories = get_directories()
+                bucket_index = get_directories_bucket_index(directories)
+                if bucket_index is None:
+                    return get_directories_page(subdir, directories)
+                return get_buckets_page(endpoint, bucket_index)
+            return get_cached_page(endpoint, signature, get_index_page)
+
+        def get_bucket_page():
+            directories = get_directories()
+            return get_directories_page(subdir, get_bucket_items(directories, get_directories_bucket_index(directories),
+                                                                 bucket))
+        return get_cached_page(subdir + '/' + bucket, signature, get_bucket_page)
+    return get_cached_page(subdir, signature, lambda: get_directories_page(subdir, get_directories()))
+
+
 def get_directories_page(subdir, directories):
     page = vtuner.Page()
     if len(directories) == 0:
@@ -48,30 +237,44 @@ def get_directories_page(subdir, directories):
         page.set_count(1)
         return page
     for directory in get_paged_elements(directories):
-        vtuner_directory = vtuner.Directory(directory.displayname,
-                                            url_for(subdir, directory=directory.name, _external=True),
-                                            directory.item_count)
-        page.add(vtuner_directory)
+        with profiling.timed('url_for'):
+            directory_url = url_for(subdir, directory=directory.name, _external=True)
+        page.add(vtuner.Directory(directory.displayname, directory_url, directory.item_count))
     page.set_count(len(directories))
     return page
 
 
-def get_stations_page(stations):
+def get_stations_page(stations, endpoint=None, bucket=None, **values):
+    bucket_index = get_bucket_index(stations, lambda station: station.name) if endpoint else None
+    if bucket_index is not None and not bucket:
+        return get_buckets_page(endpoint, bucket_index, **values)
+    if bucket:
+        stations = get_bucket_items(stations, bucket_index, bucket)
     page = vtuner.Page()
     if len(stations) == 0:
         page.add(vtuner.Display("No stations found"))
         page.set_count(1)
         return page
-    for station in get_paged_elements(stations):
+    paged_stations = get_paged_elements(stations)
+    for station in paged_stations:
+        page.add(get_vtuner_station(station))
+    page.set_count(len(stations))
+    # Check the streams in the background which users are most likely to play next
+    stream_health.submit([(station.id, station.url_resolved or station.url) for station in paged_stations
+                          if generic.get_stationid_prefix(station.id) == radiobrowser.ID_PREFIX])
+    return page
+
+
+def get_vtuner_station(station):
+    with profiling.timed('to_vtuner'):
         vtuner_station = station.to_vtuner()
+    with profiling.timed('url_for'):
         if station_tracking:
             vtuner_station.url = url_for('get_stream_url', id=vtuner_station.id, _external=True)
         else:
             vtuner_station.url = strip_https(vtuner_station.url)
         vtuner_station.icon = url_for('get_station_icon', id=vtuner_station.id, _external=True)
-        page.add(vtuner_station)
-    page.set_count(len(stations))
-    return page
+    return vtuner_station
 
 
 def get_paged_elements(items):
@@ -90,7 +293,7 @@ def get_paged_elements(items):
     if offset < 0:
         offset = 0
     if offset >= len(items):
-        logging.warning("Paging offset larger than item count")
+        logging.debug("Paging offset larger than item count")
         return []
     try:
         if request.args.get('enditems'):
@@ -107,7 +310,7 @@ def get_paged_elements(items):
     if limit < 0:
         limit = 0
     if limit <= offset:
-        logging.warning("Paging limit smaller than offset")
+        logging.debug("Paging limit smaller than offset")
         return []
     return items[offset:limit]
 
@@ -117,21 +320,83 @@ def get_station_by_id(stationid, additional_info=False):
     if station_id_prefix == my_stations.ID_PREFIX:
         return my_stations.get_station_by_id(generic.get_stationid_without_prefix(stationid))
     elif station_id_prefix == radiobrowser.ID_PREFIX:
-        station = radiobrowser.get_station_by_id(generic.get_stationid_without_prefix(stationid))
-        if station and additional_info:
-            station.get_playable_url()
-        return station
+        return radiobrowser.get_station_by_id(generic.get_stationid_without_prefix(stationid),
+                                              resolve_url=additional_info)
     return None
 
 
+def get_stream_url_by_id(stationid):
+    if generic.get_stationid_prefix(stationid) == radiobrowser.ID_PREFIX:
+        # Resolve the playable URL directly and skip the station lookup
+        radiobrowser_id = generic.get_stationid_without_prefix(stationid)
+        stream_url = radiobrowser.get_cached_playable_url_by_id(radiobrowser_id)
+        if not stream_url:
+            with rate_limited_job('play'):
+                stream_url = radiobrowser.get_playable_url_by_id(radiobrowser_id)
+        if stream_url:
+            return stream_url
+    station = get_station_by_id(stationid)
+    if not station:
+        return None
+    return station.url
+
+
 def strip_https(url):
     if url.startswith('https://'):
         url = 'http://' + url[8:]
     return url
 
 
+def get_compression_encoding():
+    if COMPRESSION_USER_AGENTS is not None and \
+            not any(user_agent in request.user_agent.string for user_agent in COMPRESSION_USER_AGENTS):
+        return None
+    return request.accept_encodings.best_match(['gzip', 'deflate'])
+
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(data, mtime=0)
+    return zlib.compress(data)
+
+
+def compress_cached_page(data, encoding):
+    # Only pages from the page cache are requested often enough for their compressed form to be worth caching
+    if 'page_cache_key' not in g:
+        return compress(data, encoding)
+    cache_key = g.page_cache_key + ':' + encoding
+    data_compressed = cache.get(cache_key)
+    if data_compressed:
+        return data_compressed
+    data_compressed = compress(data, encoding)
+    cache.set(cache_key, data_compressed, PAGE_CACHE_TTL)
+    return data_compressed
+
+
+@app.after_request
+def compress_response(response):
+    global compression_bytes_saved
+    if not compression_enabled or response.mimetype != 'text/xml' or response.status_code != 200 or \
+            response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = get_compression_encoding()
+    if not encoding:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+    data_compressed = compress_cached_page(data, encoding)
+    response.set_data(data_compressed)
+    response.headers['Content-Encoding'] = encoding
+    compression_bytes_saved += len(data) - len(data_compressed)
+    logging.debug("Compressed response from %d to %d bytes with %s (%d bytes saved in total)",
+                  len(data), len(data_compressed), encoding, compression_bytes_saved)
+    return response
+
+
 def vtuner_redirect(url):
-    if request.host and not re.search('^[A-Za-z0-9]+\.vtuner\.com$', request.host):
+    if request.host and not VTUNER_HOST_PATTERN.match(request.host):
         logging.warning("You are not accessing a YCast redirect with a whitelisted host URL (*.vtuner.com). "
                         "Some AVRs have problems with this. The requested host was: %s", request.host)
     return redirect(url, code=302)
@@ -162,92 +427,126 @@ def upstream(path):
 @app.route('/' + PATH_ROOT + '/',
            methods=['GET', 'POST'])
 def landing():
+    if my_stations_enabled:
+        my_stations_count = len(my_stations.get_category_directories())
+    else:
+        my_stations_count = None
+    return get_cached_page('landing', my_stations_count, lambda: get_landing_page(my_stations_count))
+
+
+def get_landing_page(my_stations_count):
     page = vtuner.Page()
     page.add(vtuner.Directory('Radio Browser', url_for('radiobrowser_landing', _external=True), 4))
-    if my_stations_enabled:
-        page.add(vtuner.Directory('My Stations', url_for('my_stations_landing', _external=True),
-                                  len(my_stations.get_category_directories())))
+    if my_stations_count is not None:
+        page.add(vtuner.Directory('My Stations', url_for('my_stations_landing', _external=True), my_stations_count))
     else:
         page.add(vtuner.Display("'My Stations' feature not configured"))
     page.set_count(2)
-    return page.to_string()
+    return page
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_MY_STATIONS + '/',
            methods=['GET', 'POST'])
 def my_stations_landing():
     directories = my_stations.get_category_directories()
-    return get_directories_page('my_stations_category', directories).to_string()
+    return get_cached_directories_page('my_stations_category', get_directories_signature(directories),
+                                       len(directories), lambda: directories)
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_MY_STATIONS + '/<directory>',
            methods=['GET', 'POST'])
-def my_stations_category(directory):
+@app.route('/' + PATH_ROOT + '/' + PATH_MY_STATIONS + '/<directory>/<bucket>',
+           methods=['GET', 'POST'])
+def my_stations_category(directory, bucket=None):
     stations = my_stations.get_stations_by_category(directory)
-    return get_stations_page(stations).to_string()
+    return get_stations_page(stations, 'my_stations_category', bucket, directory=directory).to_string()
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/',
            methods=['GET', 'POST'])
 def radiobrowser_landing():
+    summaries = radiobrowser.get_directories_summaries({'country': radiobrowser.MINIMUM_COUNT_COUNTRY,
+                                                        'language': radiobrowser.MINIMUM_COUNT_LANGUAGE,
+                                                        'genre': radiobrowser.MINIMUM_COUNT_GENRE})
+    counts = (summaries['country']['count'], summaries['language']['count'], summaries['genre']['count'],
+              radiobrowser.DEFAULT_STATION_LIMIT)
+    return get_cached_page('radiobrowser_landing', counts, lambda: get_radiobrowser_landing_page(counts))
+
+
+def get_radiobrowser_landing_page(counts):
     page = vtuner.Page()
-    page.add(vtuner.Directory('Countries', url_for('radiobrowser_countries', _external=True),
-                              len(radiobrowser.get_country_directories())))
-    page.add(vtuner.Directory('Languages', url_for('radiobrowser_languages', _external=True),
-                              len(radiobrowser.get_language_directories())))
-    page.add(vtuner.Directory('Genres', url_for('radiobrowser_genres', _external=True),
-                              len(radiobrowser.get_genre_directories())))
-    page.add(vtuner.Directory('Most Popular', url_for('radiobrowser_popular', _external=True),
-                              radiobrowser.DEFAULT_STATION_LIMIT))
+    page.add(vtuner.Directory('Countries', url_for('radiobrowser_countries', _external=True), counts[0]))
+    page.add(vtuner.Directory('Languages', url_for('radiobrowser_languages', _external=True), counts[1]))
+    page.add(vtuner.Directory('Genres', url_for('radiobrowser_genres', _external=True), counts[2]))
+    page.add(vtuner.Directory('Most Popular', url_for('radiobrowser_popular', _external=True), counts[3]))
     page.set_count(4)
-    return page.to_string()
+    return page
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_COUNTRY + '/',
            methods=['GET', 'POST'])
-def radiobrowser_countries():
-    directories = radiobrowser.get_country_directories()
-    return get_directories_page('radiobrowser_country_stations', directories).to_string()
+@app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_COUNTRY + '/' + PATH_BUCKET +
+           '/<bucket>',
+           methods=['GET', 'POST'])
+def radiobrowser_countries(bucket=None):
+    summary = radiobrowser.get_country_directories_summary()
+    return get_cached_directories_page('radiobrowser_country_stations', summary['signature'], summary['count'],
+                                       radiobrowser.get_country_directories, 'radiobrowser_countries', bucket)
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_COUNTRY + '/<directory>',
            methods=['GET', 'POST'])
-def radiobrowser_country_stations(directory):
+@app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_COUNTRY + '/<directory>/<bucket>',
+           methods=['GET', 'POST'])
+def radiobrowser_country_stations(directory, bucket=None):
     stations = radiobrowser.get_stations_by_country(directory)
-    return get_stations_page(stations).to_string()
+    return get_stations_page(stations, 'radiobrowser_country_stations', bucket, directory=directory).to_string()
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_LANGUAGE + '/',
            methods=['GET', 'POST'])
-def radiobrowser_languages():
-    directories = radiobrowser.get_language_directories()
-    return get_directories_page('radiobrowser_language_stations', directories).to_string()
+@app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_LANGUAGE + '/' + PATH_BUCKET +
+           '/<bucket>',
+           methods=['GET', 'POST'])
+def radiobrowser_languages(bucket=None):
+    summary = radiobrowser.get_language_directories_summary()
+    return get_cached_directories_page('radiobrowser_language_stations', summary['signature'], summary['count'],
+                                       radiobrowser.get_language_directories, 'radiobrowser_languages', bucket)
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_LANGUAGE + '/<directory>',
            methods=['GET', 'POST'])
-def radiobrowser_language_stations(directory):
+@app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_LANGUAGE + '/<directory>/<bucket>',
+           methods=['GET', 'POST'])
+def radiobrowser_language_stations(directory, bucket=None):
     stations = radiobrowser.get_stations_by_language(directory)
-    return get_stations_page(stations).to_string()
+    return get_stations_page(stations, 'radiobrowser_language_stations', bucket, directory=directory).to_string()
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_GENRE + '/',
            methods=['GET', 'POST'])
-def radiobrowser_genres():
-    directories = radiobrowser.get_genre_directories()
-    return get_directories_page('radiobrowser_genre_stations', directories).to_string()
+@app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_GENRE + '/' + PATH_BUCKET +
+           '/<bucket>',
+           methods=['GET', 'POST'])
+def radiobrowser_genres(bucket=None):
+    summary = radiobrowser.get_genre_directories_summary()
+    return get_cached_directories_page('radiobrowser_genre_stations', summary['signature'], summary['count'],
+                                       radiobrowser.get_genre_directories, 'radiobrowser_genres', bucket)
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_GENRE + '/<directory>',
            methods=['GET', 'POST'])
-def radiobrowser_genre_stations(directory):
+@app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_GENRE + '/<directory>/<bucket>',
+           methods=['GET', 'POST'])
+def radiobrowser_genre_stations(directory, bucket=None):
     stations = radiobrowser.get_stations_by_genre(directory)
-    return get_stations_page(stations).to_string()
+    return get_stations_page(stations, 'radiobrowser_genre_stations', bucket, directory=directory).to_string()
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_RADIOBROWSER + '/' + PATH_RADIOBROWSER_POPULAR + '/',
            methods=['GET', 'POST'])
 def radiobrowser_popular():
+    # Ranked by clicks, so it is never split into alphabetical buckets
     stations = radiobrowser.get_stations_by_clicks()
     return get_stations_page(stations).to_string()
 
@@ -263,7 +562,7 @@ def station_search():
         return page.to_string()
     else:
         # TODO: we also need to include 'my station' elements
-        stations = radiobrowser.search(query)
+        stations = radiobrowser.search(query, upstream_context=lambda: rate_limited_job('search'))
         return get_stations_page(stations).to_string()
 
 
@@ -274,12 +573,12 @@ def get_stream_url():
     if not stationid:
         logging.error("Stream URL without station ID requested")
         abort(400)
-    station = get_station_by_id(stationid, additional_info=True)
-    if not station:
+    stream_url = get_stream_url_by_id(stationid)
+    if not stream_url:
         logging.error("Could not get station with ID '%s'", stationid)
         abort(404)
-    logging.debug("Station with ID '%s' requested", station.id)
-    return vtuner_redirect(strip_https(station.url))
+    logging.debug("Station with ID '%s' requested", stationid)
+    return vtuner_redirect(strip_https(stream_url))
 
 
 @app.route('/' + PATH_ROOT + '/' + PATH_STATION,
@@ -296,14 +595,8 @@ def get_station_info():
         page.add(vtuner.Display("Station not found"))
         page.set_count(1)
         return page.to_string()
-    vtuner_station = station.to_vtuner()
-    if station_tracking:
-        vtuner_station.url = url_for('get_stream_url', id=vtuner_station.id, _external=True)
-    else:
-        vtuner_station.url = strip_https(vtuner_station.url)
-    vtuner_station.icon = url_for('get_station_icon', id=vtuner_station.id, _external=True)
     page = vtuner.Page()
-    page.add(vtuner_station)
+    page.add(get_vtuner_station(station))
     page.set_count(1)
     return page.to_string()
 
@@ -322,8 +615,27 @@ def get_station_icon():
     if not hasattr(station, 'icon') or not station.icon:
         logging.warning("No icon information found for station with ID '%s'", stationid)
         abort(404)
-    station_icon = station_icons.get_icon(station)
+    station_icon = station_icons.get_cached_icon(station)
+    if not station_icon:
+        with rate_limited_job('icon'):
+            station_icon = station_icons.get_icon(station)
     if not station_icon:
         logging.error("Could not get station icon for station with ID '%s'", stationid)
         abort(404)
     return Response(station_icon, mimetype='image/jpeg')
+
+
+@app.route('/' + PATH_ROOT + '/' + PATH_PROFILING + '/',
+           methods=['GET', 'POST'])
+def get_profiling_records():
+    if not profiling.enabled:
+        abort(404)
+    if not is_profiling_admin():
+        logging.warning("Profiling records requested by '%s', which is no admin", request.remote_addr)
+        abort(403)
+    if request.args.get('next'):
+        try:
+            profiling.profile_next_requests(int(request.args.get('next')))
+        except ValueError:
+            abort(400)
+    return jsonify(records=profiling.get_records(), profile_next=profiling.profile_next)
@@ -6,45 +6,74 @@ import os
 from PIL import Image
 
 import ycast.generic as generic
+import ycast.cache as cache
+import ycast.profiling as profiling
 from ycast import __version__
 
 MAX_SIZE = 290
 CACHE_NAME = 'icons'
+ICON_CACHE_TTL = 30 * 24 * 3600
 
 
-def get_icon(station):
+def get_cached_icon(station):
     cache_path = generic.get_cache_path(CACHE_NAME)
-    if not cache_path:
-        return None
-    station_icon_file = cache_path + '/' + station.id
-    if not os.path.exists(station_icon_file):
-        logging.debug("Station icon cache miss. Fetching and converting station icon for station with ID '%s'", station.id)
-        headers = {'User-Agent': generic.USER_AGENT + '/' + __version__}
-        try:
-            response = requests.get(station.icon, headers=headers)
-        except requests.exceptions.ConnectionError as e:
-            logging.error("Connection to station icon URL failed: %s", e)
-            return None
-        if response.status_code != 200:
-            logging.error("Could not get station icon data from '%s' (HTTP status %s)", station.icon, response.status_code)
-            return None
+    if cache_path and os.path.exists(cache_path + '/' + station.id):
+        station_icon_file = cache_path + '/' + station.id
         try:
-            image = Image.open(io.BytesIO(response.content)).convert('RGBA')
-            image = Image.alpha_composite(Image.new('RGBA', image.size, 'WHITE'), image).convert('RGB')
-            if image.size[0] > image.size[1]:
-                ratio = MAX_SIZE / image.size[0]
-            else:
-                ratio = MAX_SIZE / image.size[1]
-            image = image.resize((int(image.size[0] * ratio), int(image.size[1] * ratio)), Image.LANCZOS)
-            image.save(station_icon_file, format='JPEG')
-        except Exception as e:
-            logging.error("Station icon conversion error: %s", e)
+            with open(station_icon_file, 'rb') as file:
+                return file.read()
+        except PermissionError:
+            logging.error("Could not read cached station icon file '%s'", station_icon_file)
             return None
+    # Icons only go to shared cache backends, the local icon folder already covers the in-memory one
+    if cache.backend.local:
+        return None
+    image_conv = cache.get('icon:' + station.id)
+    if image_conv and cache_path:
+        write_icon_file(cache_path + '/' + station.id, image_conv)
+    return image_conv
+
+
+def write_icon_file(station_icon_file, image_conv):
     try:
-        with open(station_icon_file, 'rb') as file:
-            image_conv = file.read()
+        with open(station_icon_file, 'wb') as file:
+            file.write(image_conv)
     except PermissionError:
-        logging.error("Could not read cached station icon file '%s'",
-                      station_icon_file)
+        logging.error("Could not write cached station icon file '%s'", station_icon_file)
+
+
+def get_icon(station):
+    image_conv = get_cached_icon(station)
+    if image_conv:
+        return image_conv
+    logging.debug("Station icon cache miss. Fetching and converting station icon for station with ID '%s'", station.id)
+    headers = {'User-Agent': generic.USER_AGENT + '/' + __version__}
+    try:
+        with profiling.timed('upstream'):
+            response = requests.get(station.icon, headers=headers)
+    except requests.exceptions.ConnectionError as e:
+        logging.error("Connection to station icon URL failed: %s", e)
         return None
+    if response.status_code != 200:
+        logging.error("Could not get station icon data from '%s' (HTTP status %s)", station.icon, response.status_code)
+        return None
+    try:
+        image = Image.open(io.BytesIO(response.content)).convert('RGBA')
+        image = Image.alpha_composite(Image.new('RGBA', image.size, 'WHITE'), image).convert('RGB')
+        if image.size[0] > image.size[1]:
+            ratio = MAX_SIZE / image.size[0]
+        else:
+            ratio = MAX_SIZE / image.size[1]
+        image = image.resize((int(image.size[0] * ratio), int(image.size[1] * ratio)), Image.LANCZOS)
+        image_file = io.BytesIO()
+        image.save(image_file, format='JPEG')
+        image_conv = image_file.getvalue()
+    except Exception as e:
+        logging.error("Station icon conversion error: %s", e)
+        return None
+    cache_path = generic.get_cache_path(CACHE_NAME)
+    if cache_path:
+        write_icon_file(cache_path + '/' + station.id, image_conv)
+    if not cache.backend.local:
+        cache.set('icon:' + station.id, image_conv, ICON_CACHE_TTL)
     return image_conv
@@ -0,0 +1,180 @@
+import collections
+import concurrent.futures
+import ipaddress
+import logging
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+
+import ycast.generic as generic
+import ycast.cache as cache
+from ycast import __version__
+
+PROBE_TIMEOUT = 3
+PROBE_WORKERS = 8
+PROBE_PER_HOST = 2
+PROBE_MAX_REDIRECTS = 3
+PROBE_READ_SIZE = 1024
+PROBE_MAX_HEADER_SIZE = 16384
+PROBE_PRIVATE_ADDRESSES = False
+PROBE_INTERVAL = 3600
+MAX_PENDING = 500
+HEALTH_TTL = 6 * 3600
+SNAPSHOT_TTL = 900
+# 'rank' moves unreachable stations to the end of station lists, 'hide' drops them, 'off' only records
+FILTER_MODE = 'rank'
+
+enabled = False
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=PROBE_WORKERS)
+pending = set()
+probed = {}
+host_queues = {}
+host_probes = {}
+state_lock = threading.Lock()
+
+
+def _get_public_address(host, port):
+    # Station URLs are community submitted, so they must not make YCast connect into the local network
+    addresses = [address_info[4][0] for address_info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+    for address in addresses:
+        ip_address = ipaddress.ip_address(address.partition('%')[0])
+        if not PROBE_PRIVATE_ADDRESSES and (not ip_address.is_global or ip_address.is_multicast):
+            return None
+    return addresses[0] if addresses else None
+
+
+def _get_stream_start(url):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError("Unsupported stream URL")
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    address = _get_public_address(parts.hostname, port)
+    if not address:
+        return None
+    path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    connection = socket.create_connection((address, port), timeout=PROBE_TIMEOUT)
+    if parts.scheme == 'https':
+        connection = ssl.create_default_context().wrap_socket(connection, server_hostname=parts.hostname)
+    with connection:
+        connection.sendall(('GET ' + path + ' HTTP/1.0\r\n'
+                            'Host: ' + parts.netloc.rpartition('@')[2] + '\r\n'
+                            'User-Agent: ' + generic.USER_AGENT + '/' + __version__ + '\r\n'
+                            'Icy-MetaData: 0\r\n'
+                            'Connection: close\r\n\r\n').encode())
+        response = b''
+        while b'\r\n\r\n' not in response:
+            data = connection.recv(PROBE_READ_SIZE)
+            if not data:
+                break
+            response += data
+            if len(response) > PROBE_MAX_HEADER_SIZE:
+                raise ValueError("Response header too large")
+        head, _, data = response.partition(b'\r\n\r\n')
+        if not data:
+            data = connection.recv(PROBE_READ_SIZE)
+    lines = head.decode('latin-1').split('\r\n')
+    # SHOUTcast servers answer with an 'ICY 200 OK' status line, which HTTP libraries refuse
+    status = int(lines[0].split()[1])
+    headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in lines[1:])}
+    return status, headers, data
+
+
+def probe(url):
+    start = time.perf_counter()
+    try:
+        for _ in range(PROBE_MAX_REDIRECTS + 1):
+            stream_start = _get_stream_start(url)
+            if not stream_start:
+                logging.debug("Skipping stream probe of '%s', it is not on a public address", url)
+                return None
+            status, headers, data = stream_start
+            if status not in (301, 302, 303, 307, 308) or not headers.get('location'):
+                break
+            url = urllib.parse.urljoin(url, headers['location'])
+        latency = time.perf_counter() - start
+        # Some data must arrive quickly, a stream which only sends headers is as dead as a refused connection
+        return {
+            'reachable': status == 200 and len(data) > 0,
+            'status': status,
+            'codec': headers.get('content-type'),
+            'latency': latency
+        }
+    except (OSError, ValueError, IndexError) as e:
+        logging.debug("Stream probe of '%s' failed: %s", url, e)
+        return {'reachable': False, 'status': None, 'codec': None, 'latency': None}
+
+
+def _probe_station(station_id, url):
+    try:
+        health = probe(url)
+        if health:
+            health['timestamp'] = time.time()
+            logging.debug("Stream of station with ID '%s' probed: %s", station_id, health)
+            cache.set_json('health:' + station_id, health, HEALTH_TTL)
+    finally:
+        with state_lock:
+            probed[station_id] = time.time()
+            pending.discard(station_id)
+
+
+def _probe_host(host):
+    # Works through the queue of one stream host, so a host never gets more than PROBE_PER_HOST probes at a time
+    # while the other workers stay free for other hosts
+    while True:
+        with state_lock:
+            if not host_queues.get(host):
+                host_queues.pop(host, None)
+                host_probes[host] -= 1
+                if not host_probes[host]:
+                    del host_probes[host]
+                return
+            station_id, url = host_queues[host].popleft()
+        _probe_station(station_id, url)
+
+
+def submit(stations):
+    if not enabled:
+        return
+    now = time.time()
+    with state_lock:
+        if len(probed) > MAX_PENDING * 10:
+            for station_id in [station_id for station_id, timestamp in probed.items()
+                               if now - timestamp >= PROBE_INTERVAL]:
+                del probed[station_id]
+        for station_id, url in stations:
+            if not url or station_id in pending or now - probed.get(station_id, 0) < PROBE_INTERVAL:
+                continue
+            if len(pending) >= MAX_PENDING:
+                break
+            pending.add(station_id)
+            host = urllib.parse.urlsplit(url).hostname or ''
+            host_queues.setdefault(host, collections.deque()).append((station_id, url))
+            if host_probes.get(host, 0) < PROBE_PER_HOST:
+                host_probes[host] = host_probes.get(host, 0) + 1
+                executor.submit(_probe_host, host)
+
+
+def get_health(station_ids):
+    return {key[len('health:'):]: health for key, health in
+            cache.get_many_json(['health:' + station_id for station_id in station_ids]).items()}
+
+
+def apply(stations, list_key):
+    if not enabled or FILTER_MODE == 'off' or not stations:
+        return stations
+    # Users page through a list with several requests, so its order must not change in between
+    snapshot_key = 'health_snapshot:' + list_key
+    unreachable = cache.get_json(snapshot_key)
+    if unreachable is None:
+        health = get_health([station.id for station in stations])
+        unreachable = sorted(station_id for station_id, station_health in health.items()
+                             if not station_health['reachable'])
+        cache.set_json(snapshot_key, unreachable, SNAPSHOT_TTL)
+    unreachable = set(unreachable)
+    if not unreachable:
+        return stations
+    if FILTER_MODE == 'hide':
+        return [station for station in stations if station.id not in unreachable]
+    return sorted(stations, key=lambda station: station.id in unreachable)
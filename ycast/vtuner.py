@@ -1,5 +1,7 @@
 import xml.etree.ElementTree as ET
 
+import ycast.profiling as profiling
+
 XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
 
 
@@ -39,7 +41,8 @@ class Page:
         return xml
 
     def to_string(self):
-        return XML_HEADER + ET.tostring(self.to_xml(), encoding='unicode')
+        with profiling.timed('serialization'):
+            return XML_HEADER + ET.tostring(self.to_xml(), encoding='unicode')
 
 
 class Previous: